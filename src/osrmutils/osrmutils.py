@@ -1,12 +1,74 @@
+import asyncio
 import pandas as pd
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from collections import OrderedDict
+import threading
+from requests.adapters import HTTPAdapter
 import numpy as np
 
-iteration = 0
+# Use orjson to decode OSRM responses if it's available (much faster on the large
+# geojson/annotation responses), otherwise fall back on the standard library
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
+# aiohttp is only needed for mapmatch_many (asynchronous queries for many trajectories)
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# pyarrow is only needed for arrow-backed list columns in mapmatch_custom (arrow_lists=True)
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Shared session so that consecutive queries (e.g., chunks in mapmatch_custom) reuse 
+# keep-alive connections to the OSRM server instead of opening a new one every call
+_SESSION = requests.Session()
+_SESSION.mount('http://', HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0))
+_SESSION.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0))
+# Full geojson/annotation responses are very repetitive and compress well, so always ask for
+# compressed responses (only honored if the server, or a proxy in front of it, supports it)
+_ACCEPT_ENCODING = {'Accept-Encoding': 'gzip, deflate'}
+_SESSION.headers.update(_ACCEPT_ENCODING)
+
+
+# Since the URL fully identifies an OSRM query, successful responses are memoized by URL (least recently
+# used first out) so repeated queries (e.g., re-matching the same trajectory) don't hit the server again.
+# Raw response bytes are kept since they are much more compact than the decoded response.
+_CACHE_SIZE = 128
+_CACHE = OrderedDict()
+_CACHE_LOCK = threading.Lock()
+
+
+def _cache_get(query_request):
+    """ Returns the cached response bytes of a query (None if not cached) """
+    with _CACHE_LOCK:
+        content = _CACHE.get(query_request)
+        if content is not None:
+            _CACHE.move_to_end(query_request)
+        return content
+
+
+def _cache_put(query_request, content):
+    """ Caches the response bytes of a query, evicting the least recently used one if the cache is full """
+    with _CACHE_LOCK:
+        _CACHE[query_request] = content
+        _CACHE.move_to_end(query_request)
+        if len(_CACHE) > _CACHE_SIZE:
+            _CACHE.popitem(last=False)
+
 
 def match(osrm_server, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None,
                        steps='false', geometries='polyline', annotations='false', overview='simplified',  
-                       gaps='split', tidy='false', version='v1'):
+                       gaps='split', tidy='false', version='v1', session=None, timeout=None, use_cache=True):
 
 
     """
@@ -44,7 +106,12 @@ def match(osrm_server, latitudes, longitudes, timestamps=None, bearings=None, ra
         Allows input track splitting based on large timestamp gaps  (split/ignore)
     tidy: str, default='false'
         Allows input track modification to obtain bettermatching quality for noisy tracks (true/false)
-
+    session: requests.Session, optional
+        Session used to send the query (defaults to a module-level session with connection pooling)
+    timeout: float, optional
+        Seconds to wait for the OSRM server before giving up (default waits indefinitely)
+    use_cache: bool, default=True
+        Reuse the response of an identical previous successful query (only applies when no session is passed in)
 
     Returns
     -------
@@ -53,36 +120,119 @@ def match(osrm_server, latitudes, longitudes, timestamps=None, bearings=None, ra
     """
 
 
-    formatted_lat_lon = ''
-    for lat, lon in zip(latitudes, longitudes):
-        formatted_lat_lon += '{},{};'.format(lon,lat)
-    formatted_lat_lon = formatted_lat_lon[0:-1] # drop final semicolon
+    config = _MatchConfig(osrm_server, steps=steps, geometries=geometries, annotations=annotations, overview=overview, version=version)
+    return _match(config, latitudes, longitudes, timestamps=timestamps, bearings=bearings, radiuses=radiuses, 
+                  session=session, timeout=timeout, use_cache=use_cache)
+
+
+@dataclass(frozen=True)
+class _MatchConfig:
+
+    """ Query options that stay the same across match queries (e.g., all chunks in mapmatch_custom).  The
+        static URL prefix and suffix are formatted once here, so building each query URL is a single join.
+        Frozen so that the prefix and suffix can't go stale.  See match function for parameter details. """
+
+    osrm_server: str
+    steps: str = 'false'
+    geometries: str = 'polyline'
+    annotations: str = 'false'
+    overview: str = 'simplified'
+    version: str = 'v1'
+    prefix: str = field(init=False, repr=False)
+    suffix: str = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # Note:  'profile' can be anything -- it often says "driving" in API 
+        #         docs but the behavior entirely depends on what profile the OSRM 
+        #         server was setup with.  Leaving as 'profile' to not imply
+        object.__setattr__(self, 'prefix', '{}/match/{}/someprofile/'.format(self.osrm_server, self.version))
+        object.__setattr__(self, 'suffix', '?geometries={}&steps={}&overview={}&annotations={}'.format(
+                                               self.geometries, self.steps, self.overview, self.annotations))
+
+
+def _match(config, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None, session=None, timeout=None, use_cache=True):
+
+    """ Runs OSRM match query with a prebuilt _MatchConfig.  See match function for parameter details. """
+
+    query_request = _build_match_url(config, latitudes, longitudes, timestamps=timestamps, bearings=bearings, radiuses=radiuses)
+
+    # Only the shared session's responses are cached (a caller's session may e.g. carry different headers)
+    use_cache = use_cache and session is None
+    if use_cache:
+        content = _cache_get(query_request)
+        if content is not None:
+            return _json_loads(content)
+
+    session = session if session is not None else _SESSION
+    r = session.get(query_request, timeout=timeout)
+    if r.status_code >= 500:
+        r.raise_for_status()
+    resp = _json_loads(r.content)
+
+    # Only cache successful matches so that e.g. rate limited (429) or failed queries are retried next time
+    if use_cache and r.ok and resp.get('code') == 'Ok':
+        _cache_put(query_request, r.content)
+    return resp
+
+
+def _build_match_url(config, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None):
+    """ Builds the OSRM match query URL from a _MatchConfig.  See match function for parameter details. """
+
+    # Format all coordinates in one vectorized pass ("lon,lat;lon,lat;..."). Fixed point with 6 decimals matches
+    # OSRM's coordinate precision, keeps the URL from filling up with long doubles, and avoids exponent notation
+    # near 0 (e.g., 1e-05) that OSRM can't parse
+    lons = _format_coordinates(_as_array(longitudes, np.float64))
+    lats = _format_coordinates(_as_array(latitudes, np.float64))
+    formatted_lat_lon = ';'.join(np.char.add(np.char.add(lons, ','), lats))
     
-    # Note:  'profile' can be anything -- it often says "driving" in API 
-    #         docs but the behavior entirely depends on what profile the OSRM 
-    #         server was setup with.  Leaving as 'profile' to not imply
-    query_request = '{}/match/{}/someprofile/{}?geometries={}&steps={}&overview={}&annotations={}'.format(osrm_server, version, formatted_lat_lon, geometries, steps, overview, annotations) 
+    l_parts = [config.prefix, formatted_lat_lon, config.suffix]
     
     if timestamps is not None: 
-        formatted_timestamps = ';'.join([str(i) for i in timestamps])
-        query_request += '&timestamps={}'.format(formatted_timestamps) 
+        l_parts.append('&timestamps=')
+        l_parts.append(';'.join(map(str, timestamps)))
     
     if bearings is not None:
-        formatted_bearings = ';'.join([str(int(i)) for i in bearings])
-        query_request += '&bearings={}'.format(formatted_bearings) 
+        l_parts.append('&bearings=')
+        l_parts.append(';'.join(_as_array(bearings, np.int32).astype(str)))
 
     if radiuses is not None:
-        formatted_radiuses = ';'.join([str(int(i)) for i in radiuses])
-        query_request += '&radiuses={}'.format(formatted_radiuses) 
+        l_parts.append('&radiuses=')
+        l_parts.append(';'.join(_as_array(radiuses, np.int32).astype(str)))
 
-    r = requests.get(query_request)
-    return r.json()  
+    return ''.join(l_parts)
     
 
 
-def _mapmatch_custom(osrm_server, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None):
-    
-    global TMP;
+def _format_coordinates(values):
+
+    """ Formats coordinates as fixed point strings with (up to) 6 decimals, dropping trailing zeros """
+
+    return np.char.rstrip(np.char.rstrip(np.char.mod('%.6f', values), '0'), '.')
+
+
+def _as_array(values, dtype):
+
+    """ Converts an iterable of input values (list, numpy array, pandas series, generator, ...) to a 
+        contiguous numpy array, without copying if it already is one with the right dtype. """
+
+    if not hasattr(values, '__len__'):
+        values = list(values)
+    return np.ascontiguousarray(values, dtype=dtype)
+
+
+# Match parameters needed to postprocess responses into tracepoint/route dataframes
+_MAPMATCH_PARAMS = dict(steps='true', geometries='geojson', annotations='true', overview='full', version='v1')
+# Match parameters when only the snapped tracepoints are needed (no geometry/steps/annotations, so the 
+# server does less work and the response is a small fraction of the size)
+_TRACEPOINT_PARAMS = dict(steps='false', geometries='polyline', annotations='false', overview='false', version='v1')
+
+
+def _mapmatch_config(osrm_server, parse_legs=True):
+    """ Builds the _MatchConfig used by _mapmatch_custom """
+    return _MatchConfig(osrm_server, **(_MAPMATCH_PARAMS if parse_legs else _TRACEPOINT_PARAMS))
+
+
+def _mapmatch_custom(osrm_server, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None, parse_legs=True, config=None, use_cache=True, timeout=None):
 
     """ Performs map matching using OSRM matching service with specific parameters and postprocesses the 
         results to return pandas dataframes for (a) snapped tracepoints and (b) routes.  
@@ -102,6 +252,14 @@ def _mapmatch_custom(osrm_server, latitudes, longitudes, timestamps=None, bearin
             Ordered 0-360 degree bearings associated with coordinates
         radiuses:  iterable of int values, optional
             Ordered search radiuses (meters) associated with coordinates
+        parse_legs: bool, default=True
+            Query and return route details; if False only snapped tracepoints are queried and df_rte is None
+        config: _MatchConfig, optional
+            Prebuilt query options (from _mapmatch_config) so they aren't rebuilt for every chunk
+        use_cache: bool, default=True
+            Reuse the response of an identical previous successful query
+        timeout: float, optional
+            Seconds to wait for the OSRM server before giving up (default waits indefinitely)
         ----
     
         Returns
@@ -123,92 +281,56 @@ def _mapmatch_custom(osrm_server, latitudes, longitudes, timestamps=None, bearin
                 leg_idx: leg index within route (each route consists of 1 or more legs)
                 node_pair: list of adjacent OSM nodepairs within leg
                 distances: list of distances of nodes within leg
-                coords: list of coordinates within leg
+                coords: numpy array (n x 2, float64) of lon/lat coordinates within leg
     """
 
     # Make sure all iterables have expected indices starting at 0 
-    # (can be side effects if you pass in a series with existing indices, so prevent this)
-    latitudes = list(latitudes)
-    longitudes = list(longitudes)
-    timestamps = list(timestamps) if timestamps is not None else None 
-    bearings = list(bearings) if bearings is not None else None 
-    radiuses = list(radiuses) if radiuses is not None else None
+    # (can be side effects if you pass in a series with existing indices, so prevent this).
+    # Contiguous numpy arrays avoid copying array/series inputs and make chunk slices cheap views.
+    latitudes = _as_array(latitudes, np.float64)
+    longitudes = _as_array(longitudes, np.float64)
+    timestamps = _as_array(timestamps, np.int64) if timestamps is not None else None 
+    bearings = _as_array(bearings, np.int32) if bearings is not None else None 
+    radiuses = _as_array(radiuses, np.int32) if radiuses is not None else None
         
-    resp = match(osrm_server=osrm_server, latitudes=latitudes, longitudes=longitudes, 
-                timestamps=timestamps, bearings=bearings, radiuses=radiuses,
-                steps='true', geometries='geojson', annotations='true', overview='full',  
-                gaps='split', tidy='false', version='v1')
-    
-    l_data = []
+    config = config if config is not None else _mapmatch_config(osrm_server, parse_legs)
+    resp = _match(config, latitudes=latitudes, longitudes=longitudes, 
+                  timestamps=timestamps, bearings=bearings, radiuses=radiuses, use_cache=use_cache, timeout=timeout)
+
+    return _parse_mapmatch_response(resp, latitudes, longitudes, timestamps, parse_legs=parse_legs)
+
+
+def _parse_mapmatch_response(resp, latitudes, longitudes, timestamps=None, parse_legs=True):
+
+    """ Postprocesses an OSRM match API response (queried with _MAPMATCH_PARAMS) into the tracepoint and
+        route dataframes returned by _mapmatch_custom.  Kept free of any I/O so that it can be shared by the
+        synchronous and asynchronous query paths.  If parse_legs is False, the response only needs to contain 
+        tracepoints (queried with _TRACEPOINT_PARAMS) and the route dataframe is None.
+    """
 
-    global iteration 
-    
     code = resp.get('code')
     if code == 'Ok':  
         
         ## 1.  Enumerate over original tracepoints and build a lookup table:
         ##     key = (route_idx, waypoint_idx)
-        d_tracepoint_index = {}
-        l_tp = []
-        for tracepoint_idx, tracepoint in enumerate(resp['tracepoints']):
-            snap_lon, snap_lat = None, None
-            if tracepoint is not None:
-                route_idx = tracepoint['matchings_index'] 
-                waypoint_idx = tracepoint['waypoint_index']
-                d_tracepoint_index[(route_idx, waypoint_idx)] = tracepoint_idx 
-                snap_lon =  tracepoint['location'][0] 
-                snap_lat =  tracepoint['location'][1] 
-            tstamp = timestamps[tracepoint_idx] if timestamps is not None else None
-            l_tp.append({'tp_idx': tracepoint_idx, 'lon': longitudes[tracepoint_idx], 'lat': latitudes[tracepoint_idx], 'snap_lon': snap_lon, 'snap_lat': snap_lat, 'timestamp': tstamp})
-
-
-        l_rte = []
-        for route_idx, route in enumerate(resp['matchings']):
-            for leg_idx, leg in enumerate(route['legs']):
-                
-                # A leg is defined between two matched waypoints. When you have more than one leg in a trip, 
-                # the last waypoint in one leg  is the same as the first waypoint in the next legs. 
-
-                from_wp_idx = leg_idx
-                to_wp_idx = leg_idx + 1                
-
-                from_tracepoint_idx = d_tracepoint_index[(route_idx, from_wp_idx)]
-                to_tracepoint_idx = d_tracepoint_index[(route_idx, to_wp_idx)]
-
-                nodes = leg['annotation']['nodes']                 
-                node_pairs = [(nodes[i], nodes[i+1]) for i in range(len(nodes)-1)] 
-                distances = [round(i, 3) for i in leg['annotation']['distance']]
-                # Collect coordinates from each step, which represents the geometry of the path to the 
-                # next step in the leg.
-                coords = []
-                for step in leg['steps']:
-                    assert step['geometry']['type'] == 'LineString', "unexpected geometry type"
-                    coords.extend(step['geometry']['coordinates'])
-                # Unclear whether this is a bug or not, but it appears that in rare cases the last point
-                # is not contained in the geometry.  This coordinate will however be present in the 
-                # last step's maneuver location.
-                coords.append(leg['steps'][-1]['maneuver']['location'])
-                # Deduplicate points that were repeated when stiching together goemetries from different steps
-                coords = [coords[i] for i in range(len(coords)) if (i==0) or coords[i] != coords[i-1]]
-                
-                l_rte.append({'from_tp': from_tracepoint_idx, 'to_tp': to_tracepoint_idx, 'route_idx': route_idx, 'leg_idx': leg_idx, 'node_pairs': node_pairs, 'distances': distances, 'coords': coords})
-               
-        
-        # Make sure final route dataframe has all possible tracepoints -- even those that weren't matched (use left join)
-        df_rts_all = pd.DataFrame({'from_tp': [i for i in range(len(latitudes)-1)], 'to_tp': [i+1 for i in range(len(latitudes)-1)]})
-        df_rte = pd.DataFrame(l_rte)
-        df_rte = pd.merge(df_rts_all, df_rte, on=['from_tp', 'to_tp'], how='left')
-        df_rte['matched'] = np.where(df_rte['node_pairs'].notnull(), True, False)
-        # Fill unmatched route_idx and leg_idx 
-        df_rte['route_idx'] = df_rte['route_idx'].astype('Int64') # Nullable int type
-        df_rte['leg_idx'] = df_rte['leg_idx'].astype('Int64') # Nullable int type
-        # Fill unmatched list columns with empty lists
-        df_rte['node_pairs'] = df_rte['node_pairs'].fillna("").apply(list)
-        df_rte['distances'] = df_rte['distances'].fillna("").apply(list)
-        df_rte['coords'] = df_rte['coords'].fillna("").apply(list)
-        df_rte = df_rte[['from_tp', 'to_tp', 'matched', 'route_idx', 'leg_idx', 'node_pairs', 'distances', 'coords']]
-
-        df_tp = pd.DataFrame(l_tp)
+        d_tracepoint_index = {(tracepoint['matchings_index'], tracepoint['waypoint_index']): tracepoint_idx
+                              for tracepoint_idx, tracepoint in enumerate(resp['tracepoints']) if tracepoint is not None}
+
+        ##     Extract all snapped coordinates (NaN where unmatched) into one array in a single pass so that
+        ##     the tracepoint dataframe can be built column-wise in a single step.
+        n_tracepoints = len(resp['tracepoints'])
+        snap_locs = np.asarray([tracepoint['location'] if tracepoint is not None else (np.nan, np.nan) 
+                                for tracepoint in resp['tracepoints']], dtype=np.float64).reshape(n_tracepoints, 2)
+        snap_lons = snap_locs[:, 0]
+        snap_lats = snap_locs[:, 1]
+
+
+        ## 2.  Build the route dataframe (skipped if only the snapped tracepoints were requested)
+        df_rte = _build_route_df(resp, d_tracepoint_index, n_tracepoints) if parse_legs else None
+
+        df_tp = pd.DataFrame({'tp_idx': np.arange(n_tracepoints), 'lon': np.asarray(longitudes), 'lat': np.asarray(latitudes), 
+                              'snap_lon': snap_lons, 'snap_lat': snap_lats, 
+                              'timestamp': np.asarray(timestamps) if timestamps is not None else None})
     
     # query not okay
     else:
@@ -218,7 +340,93 @@ def _mapmatch_custom(osrm_server, latitudes, longitudes, timestamps=None, bearin
     return df_tp, df_rte, code
 
 
-def mapmatch_custom(osrm_server, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None, max_matching_size=100):
+def _build_route_df(resp, d_tracepoint_index, n_tracepoints):
+
+    """ Builds the route dataframe (one row per pair of consecutive tracepoints) from the matchings of an
+        OSRM match API response.  See _mapmatch_custom for the columns. """
+
+    # Make sure final route dataframe has all possible tracepoint pairs -- even those that weren't matched.
+    # Rows are indexed by from_tp (pairs are always (i, i+1)), so preallocate every column and
+    # write each matched leg directly into its row.
+    n_legs = max(n_tracepoints - 1, 0)
+    matched = np.zeros(n_legs, dtype=bool)
+    route_idxs = np.zeros(n_legs, dtype=np.int64)
+    leg_idxs = np.zeros(n_legs, dtype=np.int64)
+    l_node_pairs = [[] for _ in range(n_legs)]
+    l_distances = [[] for _ in range(n_legs)]
+    l_coords = [np.empty((0, 2), dtype=np.float64) for _ in range(n_legs)]
+    for route_idx, route in enumerate(resp['matchings']):
+        for leg_idx, leg in enumerate(route['legs']):
+
+            # A leg is defined between two matched waypoints. When you have more than one leg in a trip, 
+            # the last waypoint in one leg  is the same as the first waypoint in the next legs. 
+
+            from_wp_idx = leg_idx
+            to_wp_idx = leg_idx + 1                
+
+            from_tracepoint_idx = d_tracepoint_index[(route_idx, from_wp_idx)]
+            to_tracepoint_idx = d_tracepoint_index[(route_idx, to_wp_idx)]
+
+            # Legs that span unmatched tracepoints don't correspond to a (i, i+1) pair, so they are dropped
+            if to_tracepoint_idx != from_tracepoint_idx + 1:
+                continue
+
+            node_pairs, distances, coords = _build_leg_rows(*_parse_leg(leg))
+
+            matched[from_tracepoint_idx] = True
+            route_idxs[from_tracepoint_idx] = route_idx
+            leg_idxs[from_tracepoint_idx] = leg_idx
+            l_node_pairs[from_tracepoint_idx] = node_pairs
+            l_distances[from_tracepoint_idx] = distances
+            l_coords[from_tracepoint_idx] = coords
+
+    # Unmatched rows get null route_idx and leg_idx (nullable int type) and empty lists
+    df_rte = pd.DataFrame({'from_tp': np.arange(n_legs), 'to_tp': np.arange(1, n_legs + 1), 'matched': matched, 
+                           'route_idx': pd.arrays.IntegerArray(route_idxs, ~matched), 
+                           'leg_idx': pd.arrays.IntegerArray(leg_idxs, ~matched), 
+                           'node_pairs': l_node_pairs, 'distances': l_distances, 'coords': l_coords})
+
+    return df_rte
+
+
+def _parse_leg(leg):
+
+    """ Extracts the node ids, node distances and stitched step geometry of a route leg (from the OSRM
+        json response) into numpy arrays, so the remaining leg processing works on typed arrays only. """
+
+    # OSM node ids can exceed 2^31, so keep them as int64
+    nodes = np.asarray(leg['annotation']['nodes'], dtype=np.int64)
+    distances = np.asarray(leg['annotation']['distance'], dtype=np.float64)
+    # Collect coordinates from each step, which represents the geometry of the path to the 
+    # next step in the leg.
+    coords = []
+    for step in leg['steps']:
+        assert step['geometry']['type'] == 'LineString', "unexpected geometry type"
+        coords.extend(step['geometry']['coordinates'])
+    # Unclear whether this is a bug or not, but it appears that in rare cases the last point
+    # is not contained in the geometry.  This coordinate will however be present in the 
+    # last step's maneuver location.
+    coords.append(leg['steps'][-1]['maneuver']['location'])
+    coords = np.asarray(coords, dtype=np.float64)
+    return nodes, distances, coords
+
+
+def _build_leg_rows(nodes, distances, coords):
+
+    """ Converts the arrays from _parse_leg into the node_pairs, distances and coords values of a 
+        route dataframe row """
+
+    node_pairs = list(map(tuple, np.column_stack((nodes[:-1], nodes[1:])).tolist()))
+    distances = np.round(distances, 3).tolist()
+    # Deduplicate points that were repeated when stiching together goemetries from different steps
+    keep = np.concatenate(([True], np.any(coords[1:] != coords[:-1], axis=1)))
+    # Store as a single array rather than lists of boxed floats (kept as float64 to preserve the full 
+    # precision of the OSRM coordinates)
+    coords = coords[keep]
+    return node_pairs, distances, coords
+
+
+def mapmatch_custom(osrm_server, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None, max_matching_size=100, max_workers=4, parse_legs=True, arrow_lists=False, use_cache=True, timeout=None):
 
     """  Wrapper for perform_osm_snapping that accounts for the fact that the OSRM server can only process
         a limited number of points at a time. To account for arbitrary trip lengths, this function splits
@@ -239,11 +447,24 @@ def mapmatch_custom(osrm_server, latitudes, longitudes, timestamps=None, bearing
             Ordered search radiuses (meters) associated with coordinates
         max_matching_size: int, default=100
              Max number of waypoints that can be processed by OSRM in a single request (depends on server settings)
+        max_workers: int, default=4
+             Max number of requests sent to the OSRM server concurrently (use 1 to send them sequentially)
+        parse_legs: bool, default=True
+             Query and return route details; if False only snapped tracepoints are queried (much smaller 
+             responses) and df_rte is None
+        arrow_lists: bool, default=False
+             Store the node_pairs, distances and coords columns of df_rte as pyarrow backed list columns 
+             (pd.ArrowDtype) instead of python objects, which takes far less memory.  Coordinates are stored 
+             as float32 here, which resolves them to within ~1 m.  Requires pyarrow.
+        use_cache: bool, default=True
+             Reuse the responses of identical previous successful queries (set False to always query the server)
+        timeout: float, optional
+             Seconds to wait for the OSRM server before giving up on a query (default waits indefinitely)
         ----
     
         Returns
         -------
-        (df_tp, df_rte):  tuple of pandas dataframes
+        (df_tp, df_rte, l_code):  tuple of pandas dataframes and list of query codes
 
             df_tp:  pandas dataframe of snapped tracepoints
                 query_idx: index of query (>0 only where where multiple api calls needed)
@@ -262,55 +483,247 @@ def mapmatch_custom(osrm_server, latitudes, longitudes, timestamps=None, bearing
                 leg_idx: leg index within route (each route consists of 1 or more legs)
                 node_pair: list of adjacent OSM nodepairs within leg
                 distances: list of distances of nodes within leg
-                coords: list of coordinates within leg
+                coords: numpy array (n x 2, float64) of lon/lat coordinates within leg
+
+            l_code:  list of OSRM response codes, one per query (e.g., 'Ok', 'NoMatch').  A query that failed 
+                (connection error, timeout, server error, ...) doesn't raise; its code describes the error 
+                instead (e.g., 'HTTPError: 502 Server Error: ...') and its chunk is left out of df_tp and df_rte.
 
     """
     # Make sure all iterables have expected indices starting at 0 
-    # (can be side effects if you pass in a series with existing indices, so prevent this)
-    latitudes = list(latitudes)
-    longitudes = list(longitudes)
-    timestamps = list(timestamps) if timestamps is not None else None 
-    bearings = list(bearings) if bearings is not None else None 
-    radiuses = list(radiuses) if radiuses is not None else None
+    # (can be side effects if you pass in a series with existing indices, so prevent this).
+    # Contiguous numpy arrays avoid copying array/series inputs and make chunk slices cheap views.
+    latitudes = _as_array(latitudes, np.float64)
+    longitudes = _as_array(longitudes, np.float64)
+    timestamps = _as_array(timestamps, np.int64) if timestamps is not None else None 
+    bearings = _as_array(bearings, np.int32) if bearings is not None else None 
+    radiuses = _as_array(radiuses, np.int32) if radiuses is not None else None
         
     
-    l_tp = []
-    l_rte = []
-    l_code = []
+    # Enumerate the (query_idx, lower_idx, upper_idx) slices up front so the queries can be sent concurrently
+    l_slices = _chunk_slices(len(latitudes), max_matching_size)
 
-    n_waypoints = len(latitudes)
+    # Each query is I/O bound (waiting on the OSRM server), so use threads to keep several in flight at once
+    config = _mapmatch_config(osrm_server, parse_legs)
+    d_results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        d_futures = {}
+        for query_idx, lower_idx, upper_idx in l_slices:
+            _latitudes = latitudes[lower_idx:upper_idx]
+            _longitudes = longitudes[lower_idx:upper_idx]
+            _timestamps = timestamps[lower_idx:upper_idx] if timestamps is not None else None
+            _bearings = bearings[lower_idx:upper_idx] if bearings is not None else None
+            _radiuses = radiuses[lower_idx:upper_idx] if radiuses is not None else None
 
-    query_idx = 0
+            future = executor.submit(_mapmatch_custom, osrm_server, _latitudes, _longitudes, _timestamps, _bearings, _radiuses, parse_legs, config, use_cache, timeout)
+            d_futures[future] = query_idx
 
+        for future in as_completed(d_futures):
+            # A failed query (connection error, timeout, server error, ...) only loses its own chunk
+            try:
+                d_results[d_futures[future]] = future.result()
+            except Exception as e:
+                d_results[d_futures[future]] = (None, None, _error_code(e))
+
+    # Combine results in query order (futures complete in arbitrary order)
+    df_tp, df_rte, l_code = _combine_chunks([d_results[query_idx] for query_idx in sorted(d_results)])
+
+    if arrow_lists and df_rte is not None:
+        df_rte = _to_arrow_lists(df_rte)
+    return df_tp, df_rte, l_code
+
+
+def _error_code(e):
+    """ Describes an exception raised by a failed query, for reporting in place of the OSRM response code """
+    return '{}: {}'.format(type(e).__name__, e)
+
+
+def _chunk_slices(n_waypoints, max_matching_size):
+
+    """ Splits a trajectory of n_waypoints into (query_idx, lower_idx, upper_idx) slices of at most 
+        max_matching_size points, where consecutive slices share one point so that no leg is lost. """
+
+    l_slices = []
+    query_idx = 0
     while True:
 
         lower_idx = query_idx*(max_matching_size-1) # subtract 1 to start with the last pt of previous iter
         upper_idx = min(lower_idx+max_matching_size, n_waypoints)
-        
-        #print('lower_idx: {}, upper_idx: {}'.format(lower_idx, upper_idx))
-        _latitudes = latitudes[lower_idx:upper_idx]
-        _longitudes = longitudes[lower_idx:upper_idx]
-        _timestamps = timestamps[lower_idx:upper_idx] if timestamps is not None else None
-        _bearings = bearings[lower_idx:upper_idx] if bearings is not None else None
-        _radiuses = radiuses[lower_idx:upper_idx] if radiuses is not None else None
+        l_slices.append((query_idx, lower_idx, upper_idx))
+
+        if upper_idx == n_waypoints:
+            break
+        query_idx += 1
+
+    return l_slices
+
 
-        _df_tp, _df_rte, code = _mapmatch_custom(osrm_server, _latitudes, _longitudes, _timestamps, _bearings, _radiuses)
+def _combine_chunks(l_results):
+
+    """ Combines the ordered (df_tp, df_rte, code) results of each chunk into the output of mapmatch_custom """
+
+    l_tp = []
+    l_rte = []
+    l_code = []
+
+    for query_idx, (_df_tp, _df_rte, code) in enumerate(l_results):
         
         l_code.append(code)
 
         if code == 'Ok':
             # add index to specify the iteration
             _df_tp.insert(0, 'query_idx', query_idx)
-            _df_rte.insert(0, 'query_idx', query_idx)
             l_tp.append(_df_tp)
-            l_rte.append(_df_rte)
-        
-        if upper_idx == n_waypoints:
-            break
-        query_idx += 1
-        global iteration 
-        iteration += 1
+            if _df_rte is not None:
+                _df_rte.insert(0, 'query_idx', query_idx)
+                l_rte.append(_df_rte)
+
+    df_tp = pd.concat(l_tp, ignore_index=True) if len(l_tp) > 0 else None
+    df_rte = pd.concat(l_rte, ignore_index=True) if len(l_rte) > 0 else None
+    return df_tp, df_rte, l_code
+
+
+def _to_arrow_lists(df_rte):
+
+    """ Converts the node_pairs, distances and coords columns of a route dataframe to pyarrow backed list
+        columns: list<fixed_size_list<int64, 2>>, list<double> and list<fixed_size_list<float, 2>> """
+
+    if pa is None:
+        raise ImportError("arrow_lists=True requires pyarrow (e.g., 'python -m pip install pyarrow')")
+
+    df_rte = df_rte.copy()
+    df_rte['node_pairs'] = _arrow_list_of_pairs(df_rte['node_pairs'], np.int64, df_rte.index)
+    df_rte['distances'] = pd.Series(pd.arrays.ArrowExtensionArray(pa.array(list(df_rte['distances']), type=pa.list_(pa.float64()))), 
+                                    index=df_rte.index)
+    df_rte['coords'] = _arrow_list_of_pairs(df_rte['coords'], np.float32, df_rte.index)
+    return df_rte
+
+
+def _arrow_list_of_pairs(values, dtype, index):
+
+    """ Builds an arrow list<fixed_size_list<dtype, 2>> series from an iterable of (n x 2) array-likes by 
+        concatenating all pairs into one flat buffer with offsets, rather than converting row by row """
+
+    l_arrays = [np.asarray(v, dtype=dtype).reshape(-1, 2) for v in values]
+    offsets = np.zeros(len(l_arrays) + 1, dtype=np.int32)
+    np.cumsum([len(a) for a in l_arrays], out=offsets[1:])
+    flat_values = np.concatenate(l_arrays).ravel() if len(l_arrays) > 0 else np.empty(0, dtype=dtype)
+    arrow_values = pa.ListArray.from_arrays(pa.array(offsets), pa.FixedSizeListArray.from_arrays(pa.array(flat_values), 2))
+    return pd.Series(pd.arrays.ArrowExtensionArray(arrow_values), index=index)
+
+
+async def _amatch(session, query_request, use_cache=True):
+
+    """ Asynchronous counterpart of _match that sends a prebuilt query with an aiohttp session.  Server 
+        errors (5xx) raise and successful responses share the cache, like in _match. """
+
+    if use_cache:
+        content = _cache_get(query_request)
+        if content is not None:
+            return _json_loads(content)
+
+    async with session.get(query_request) as r:
+        if r.status >= 500:
+            r.raise_for_status()
+        content = await r.read()
+    resp = _json_loads(content)
+
+    if use_cache and r.ok and resp.get('code') == 'Ok':
+        _cache_put(query_request, content)
+    return resp
+
+
+async def _amapmatch_custom(session, osrm_server, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None, max_matching_size=100, parse_legs=True, arrow_lists=False, config=None, use_cache=True):
+
+    """ Asynchronous counterpart of mapmatch_custom for a single trajectory.  All chunks of the trajectory
+        are queried concurrently and postprocessed in query order once the responses are in.  A chunk whose
+        query fails (connection error, server error, non-JSON response, ...) doesn't affect the other chunks
+        or trajectories; the error is reported as its code instead (e.g., 'ClientResponseError: 502, ...'), 
+        like in mapmatch_custom.
+    """
+
+    latitudes = _as_array(latitudes, np.float64)
+    longitudes = _as_array(longitudes, np.float64)
+    timestamps = _as_array(timestamps, np.int64) if timestamps is not None else None 
+    bearings = _as_array(bearings, np.int32) if bearings is not None else None 
+    radiuses = _as_array(radiuses, np.int32) if radiuses is not None else None
+
+    l_slices = _chunk_slices(len(latitudes), max_matching_size)
+    config = config if config is not None else _mapmatch_config(osrm_server, parse_legs)
+    
+    l_requests = []
+    for query_idx, lower_idx, upper_idx in l_slices:
+        query_request = _build_match_url(config, latitudes[lower_idx:upper_idx], longitudes[lower_idx:upper_idx], 
+                                         timestamps=timestamps[lower_idx:upper_idx] if timestamps is not None else None, 
+                                         bearings=bearings[lower_idx:upper_idx] if bearings is not None else None, 
+                                         radiuses=radiuses[lower_idx:upper_idx] if radiuses is not None else None)
+        l_requests.append(_amatch(session, query_request, use_cache=use_cache))
+    l_resps = await asyncio.gather(*l_requests, return_exceptions=True)
+
+    l_results = []
+    for (query_idx, lower_idx, upper_idx), resp in zip(l_slices, l_resps):
+        if isinstance(resp, BaseException):
+            if not isinstance(resp, Exception):
+                raise resp # don't swallow cancellation
+            resp = {'code': _error_code(resp)}
+        _timestamps = timestamps[lower_idx:upper_idx] if timestamps is not None else None
+        l_results.append(_parse_mapmatch_response(resp, latitudes[lower_idx:upper_idx], longitudes[lower_idx:upper_idx], _timestamps, 
+                                                  parse_legs=parse_legs))
+
+    df_tp, df_rte, l_code = _combine_chunks(l_results)
+
+    if arrow_lists and df_rte is not None:
+        df_rte = _to_arrow_lists(df_rte)
+    return df_tp, df_rte, l_code
+
+
+async def mapmatch_many(osrm_server, trajectories, max_matching_size=100, concurrency=32, parse_legs=True, arrow_lists=False, use_cache=True, timeout=None):
+
+    """ Map matches many independent trajectories at once, with the same options and results as 
+        mapmatch_custom.  Queries are sent asynchronously over a single aiohttp session, so up to 
+        `concurrency` requests are in flight at any time (the OSRM server's number of worker threads is 
+        usually the real limit).  Requires aiohttp.  This is a coroutine, so from synchronous code call 
+        it with asyncio.run(mapmatch_many(...)).
+
+        ----------
+        osmr_server : str 
+            OSRM server address containing ip address and port (e.g., 'http://127.0.0.1:5000')
+        trajectories : iterable of dicts
+            One dict per trajectory, with keys matching the mapmatch_custom arguments: 'latitudes' and 
+            'longitudes' (required), 'timestamps', 'bearings' and 'radiuses' (optional)
+        max_matching_size: int, default=100
+             Max number of waypoints that can be processed by OSRM in a single request (depends on server settings)
+        concurrency: int, default=32
+             Max number of simultaneous connections to the OSRM server
+        parse_legs: bool, default=True
+             Query and return route details; if False only snapped tracepoints are queried and df_rte is None
+        arrow_lists: bool, default=False
+             Store the list columns of df_rte as pyarrow backed list columns (see mapmatch_custom)
+        use_cache: bool, default=True
+             Reuse the responses of identical previous successful queries (shared with mapmatch_custom)
+        timeout: float, optional
+             Seconds to wait for the OSRM server to connect or send data before giving up on a query (default 
+             waits indefinitely). Time spent waiting for a free connection doesn't count.
+        ----
+    
+        Returns
+        -------
+        l_results:  list of (df_tp, df_rte, l_code) tuples
+            One tuple per trajectory, in the same order as trajectories.  See mapmatch_custom for details.
+            As in mapmatch_custom, chunks whose query failed (e.g., a connection error or a server error) are 
+            reported in l_code with a description of the error instead of raising.
+    """
 
-    df_tp = pd.concat(l_tp).reset_index(drop=True) if len(l_tp) > 0 else None
-    df_rte = pd.concat(l_rte).reset_index(drop=True) if len(l_rte) > 0 else None
-    return df_tp, df_rte, l_code
\ No newline at end of file
+    if aiohttp is None:
+        raise ImportError("mapmatch_many requires aiohttp (e.g., 'python -m pip install aiohttp')")
+
+    config = _mapmatch_config(osrm_server, parse_legs)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    # Like the timeout in match, limit connecting and reading only (a total timeout would also count time spent 
+    # queued behind other requests for one of the `concurrency` connections)
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    async with aiohttp.ClientSession(connector=connector, headers=_ACCEPT_ENCODING, timeout=client_timeout) as session:
+        l_results = await asyncio.gather(*[_amapmatch_custom(session, osrm_server, max_matching_size=max_matching_size, parse_legs=parse_legs, 
+                                                             arrow_lists=arrow_lists, config=config, use_cache=use_cache, **trajectory) 
+                                           for trajectory in trajectories])
+    return list(l_results)
@@ -0,0 +1,343 @@
+import asyncio
+import dataclasses
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from osrmutils import osrmutils
+
+
+def test_chunk_slices_boundaries():
+    assert osrmutils._chunk_slices(0, 100) == [(0, 0, 0)]
+    assert osrmutils._chunk_slices(100, 100) == [(0, 0, 100)]
+    assert osrmutils._chunk_slices(101, 100) == [(0, 0, 100), (1, 99, 101)]
+
+
+def test_chunk_slices_cover_trajectory():
+    for n_waypoints in [1, 2, 99, 100, 101, 197, 198, 199, 1000]:
+        l_slices = osrmutils._chunk_slices(n_waypoints, 100)
+        assert [query_idx for query_idx, _, _ in l_slices] == list(range(len(l_slices)))
+        assert all(upper_idx - lower_idx <= 100 for _, lower_idx, upper_idx in l_slices)
+        # consecutive chunks share one point so that no leg is lost
+        assert all(l_slices[i][1] == l_slices[i-1][2] - 1 for i in range(1, len(l_slices)))
+        assert l_slices[0][1] == 0 and l_slices[-1][2] == n_waypoints
+
+
+def test_build_match_url():
+    config = osrmutils._MatchConfig('http://127.0.0.1:5000')
+    query_request = osrmutils._build_match_url(config, (lat for lat in [0.00001, -38.9, 51.4779]), 
+                                               (lon for lon in [-0.0000004, 77.0, -0.0014]), 
+                                               timestamps=[1, 2, 3], bearings=[10.7, 20, 30], radiuses=[5, 5.5, 6])
+    assert query_request == ('http://127.0.0.1:5000/match/v1/someprofile/-0,0.00001;77,-38.9;-0.0014,51.4779'
+                             '?geometries=polyline&steps=false&overview=simplified&annotations=false'
+                             '&timestamps=1;2;3&bearings=10;20;30&radiuses=5;5;6')
+
+
+def test_match_config_is_frozen():
+    config = osrmutils._MatchConfig('http://127.0.0.1:5000', overview='full')
+    assert config.prefix == 'http://127.0.0.1:5000/match/v1/someprofile/'
+    assert config.suffix == '?geometries=polyline&steps=false&overview=full&annotations=false'
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.overview = 'false'
+
+
+def test_mapmatch_custom_sends_chunks(monkeypatch):
+    l_sent = []
+
+    def fake_match(config, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None, **kwargs):
+        l_sent.append((len(latitudes), len(longitudes), len(timestamps)))
+        return {'code': 'NoMatch'}
+
+    monkeypatch.setattr(osrmutils, '_match', fake_match)
+    n = 250
+    df_tp, df_rte, l_code = osrmutils.mapmatch_custom('http://127.0.0.1:5000', np.zeros(n), np.zeros(n), 
+                                                      np.arange(n), max_matching_size=100, max_workers=1)
+    assert df_tp is None and df_rte is None
+    assert l_code == ['NoMatch'] * 3
+    assert [sizes[0] for sizes in l_sent] == [100, 100, 52]
+    assert all(len(set(sizes)) == 1 for sizes in l_sent)
+
+
+class _FakeResponse:
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = content
+
+
+class _FakeSession:
+
+    def __init__(self, l_responses):
+        self.l_responses = list(l_responses)
+        self.n_calls = 0
+
+    def get(self, query_request, timeout=None):
+        self.n_calls += 1
+        return self.l_responses.pop(0)
+
+
+def test_match_caches_only_successful_responses(monkeypatch):
+    session = _FakeSession([_FakeResponse(429, b'{"message": "Too Many Requests"}'),
+                            _FakeResponse(200, b'{"code": "Ok"}')])
+    monkeypatch.setattr(osrmutils, '_SESSION', session)
+    monkeypatch.setattr(osrmutils, '_CACHE', osrmutils.OrderedDict())
+
+    assert osrmutils.match('http://127.0.0.1:5000', [1.0, 1.1], [2.0, 2.1]) == {'message': 'Too Many Requests'}
+    assert osrmutils.match('http://127.0.0.1:5000', [1.0, 1.1], [2.0, 2.1]) == {'code': 'Ok'}
+    assert osrmutils.match('http://127.0.0.1:5000', [1.0, 1.1], [2.0, 2.1]) == {'code': 'Ok'}
+    assert session.n_calls == 2
+
+
+def test_match_raises_on_server_error(monkeypatch):
+    class _ErrorResponse(_FakeResponse):
+        def raise_for_status(self):
+            raise osrmutils.requests.HTTPError('502 Server Error')
+
+    for use_cache in [True, False]:
+        monkeypatch.setattr(osrmutils, '_SESSION', _FakeSession([_ErrorResponse(502, b'<html>Bad gateway</html>')]))
+        with pytest.raises(osrmutils.requests.HTTPError):
+            osrmutils.match('http://127.0.0.1:5000', [1.0, 1.1], [2.0, 2.1], use_cache=use_cache)
+
+
+def _ok_response(latitudes, longitudes):
+    # every tracepoint matched, in a single matching with one leg per pair of consecutive tracepoints
+    locations = [[lon, lat] for lat, lon in zip(latitudes, longitudes)]
+    return {'code': 'Ok',
+            'tracepoints': [{'matchings_index': 0, 'waypoint_index': i, 'location': location} for i, location in enumerate(locations)],
+            'matchings': [{'legs': [_leg([i, i + 1], [1.0], [[locations[i], locations[i + 1]]]) for i in range(len(locations) - 1)]}]}
+
+
+def test_mapmatch_custom_keeps_chunk_order(monkeypatch):
+    # each chunk only finishes after the chunk that follows it, so chunks complete in reverse order
+    n_waypoints, max_matching_size = 250, 100
+    l_slices = osrmutils._chunk_slices(n_waypoints, max_matching_size)
+    l_done = [threading.Event() for _ in l_slices]
+    l_completed = []
+
+    def fake_match(config, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None, **kwargs):
+        query_idx = [lower_idx for _, lower_idx, _ in l_slices].index(int(latitudes[0]))
+        if query_idx + 1 < len(l_slices):
+            assert l_done[query_idx + 1].wait(timeout=5)
+        l_completed.append(query_idx)
+        l_done[query_idx].set()
+        return _ok_response(latitudes, longitudes)
+
+    monkeypatch.setattr(osrmutils, '_match', fake_match)
+    latitudes = np.arange(n_waypoints, dtype=float)
+    df_tp, df_rte, l_code = osrmutils.mapmatch_custom('http://127.0.0.1:5000', latitudes, latitudes, 
+                                                      max_matching_size=max_matching_size, max_workers=len(l_slices))
+
+    assert l_completed == [2, 1, 0]
+    assert l_code == ['Ok'] * 3
+    expected_query_idx = np.concatenate([np.full(upper_idx - lower_idx, query_idx) for query_idx, lower_idx, upper_idx in l_slices])
+    assert df_tp['query_idx'].tolist() == expected_query_idx.tolist()
+    expected_lat = np.concatenate([latitudes[lower_idx:upper_idx] for _, lower_idx, upper_idx in l_slices])
+    assert df_tp['lat'].tolist() == expected_lat.tolist()
+    assert df_rte['query_idx'].tolist() == [query_idx for query_idx, lower_idx, upper_idx in l_slices for _ in range(upper_idx - lower_idx - 1)]
+    np.testing.assert_array_equal([coords[0][1] for coords in df_rte['coords']], 
+                                  np.concatenate([latitudes[lower_idx:upper_idx - 1] for _, lower_idx, upper_idx in l_slices]))
+
+
+def test_mapmatch_custom_reports_failed_chunks(monkeypatch):
+    def fake_match(config, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None, **kwargs):
+        if latitudes[0] == 99:
+            raise osrmutils.requests.HTTPError('502 Server Error')
+        return _ok_response(latitudes, longitudes)
+
+    monkeypatch.setattr(osrmutils, '_match', fake_match)
+    latitudes = np.arange(250, dtype=float)
+    df_tp, df_rte, l_code = osrmutils.mapmatch_custom('http://127.0.0.1:5000', latitudes, latitudes, 
+                                                      max_matching_size=100, max_workers=3)
+
+    assert l_code == ['Ok', 'HTTPError: 502 Server Error', 'Ok']
+    assert df_tp['query_idx'].unique().tolist() == [0, 2]
+    assert df_rte['query_idx'].unique().tolist() == [0, 2]
+
+def test_mapmatch_custom_passes_timeout(monkeypatch):
+    l_timeouts = []
+
+    def fake_match(config, latitudes, longitudes, timestamps=None, bearings=None, radiuses=None, use_cache=True, timeout=None):
+        l_timeouts.append(timeout)
+        return {'code': 'NoMatch'}
+
+    monkeypatch.setattr(osrmutils, '_match', fake_match)
+    osrmutils.mapmatch_custom('http://127.0.0.1:5000', np.zeros(150), np.zeros(150), timeout=2.5)
+    assert l_timeouts == [2.5, 2.5]
+
+
+def _leg(nodes, distances, step_coords):
+    steps = [{'geometry': {'type': 'LineString', 'coordinates': coords}, 'maneuver': {'location': coords[0]}}
+             for coords in step_coords]
+    # like OSRM, the last step of a leg is an 'arrive' step at the final coordinate
+    end = step_coords[-1][-1]
+    steps.append({'geometry': {'type': 'LineString', 'coordinates': [end, end]}, 'maneuver': {'location': end}})
+    return {'annotation': {'nodes': nodes, 'distance': distances}, 'steps': steps}
+
+
+def _response_with_unmatched_tracepoint():
+    # tracepoint 2 is unmatched, so the only legs are 0 -> 1 and 1 -> 3
+    return {'code': 'Ok',
+            'tracepoints': [{'matchings_index': 0, 'waypoint_index': 0, 'location': [2.01, 1.01]},
+                            {'matchings_index': 0, 'waypoint_index': 1, 'location': [2.11, 1.11]},
+                            None,
+                            {'matchings_index': 0, 'waypoint_index': 2, 'location': [2.31, 1.31]}],
+            'matchings': [{'legs': [_leg([5, 6, 7], [1.23456, 2.34567], [[[2.01, 1.01], [2.05, 1.05]], [[2.05, 1.05], [2.11, 1.11]]]),
+                                    _leg([7, 8], [3.0], [[[2.11, 1.11], [2.31, 1.31]]])]}]}
+
+
+def test_parse_mapmatch_response():
+    latitudes = [1.0, 1.1, 1.2, 1.3]
+    longitudes = [2.0, 2.1, 2.2, 2.3]
+    timestamps = [10, 20, 30, 40]
+
+    df_tp, df_rte, code = osrmutils._parse_mapmatch_response(_response_with_unmatched_tracepoint(), latitudes, longitudes, timestamps)
+
+    assert code == 'Ok'
+    assert df_tp['tp_idx'].tolist() == [0, 1, 2, 3]
+    assert df_tp['timestamp'].tolist() == timestamps
+    np.testing.assert_array_equal(df_tp['snap_lon'], [2.01, 2.11, np.nan, 2.31])
+    np.testing.assert_array_equal(df_tp['snap_lat'], [1.01, 1.11, np.nan, 1.31])
+
+    assert df_rte['from_tp'].tolist() == [0, 1, 2]
+    assert df_rte['to_tp'].tolist() == [1, 2, 3]
+    # the leg spanning the unmatched tracepoint doesn't map to a (i, i+1) row
+    assert df_rte['matched'].tolist() == [True, False, False]
+    assert df_rte['route_idx'].dtype == 'Int64' and df_rte['leg_idx'].dtype == 'Int64'
+    assert df_rte['route_idx'][0] == 0 and df_rte['leg_idx'][0] == 0
+    assert df_rte['route_idx'][1:].isna().all() and df_rte['leg_idx'][1:].isna().all()
+    assert df_rte['node_pairs'][0] == [(5, 6), (6, 7)]
+    assert df_rte['distances'][0] == [1.235, 2.346]
+    # repeated step boundary points are deduplicated
+    np.testing.assert_allclose(df_rte['coords'][0], [[2.01, 1.01], [2.05, 1.05], [2.11, 1.11]], atol=1e-6)
+    assert df_rte['node_pairs'][1] == [] and df_rte['distances'][1] == [] and len(df_rte['coords'][1]) == 0
+
+
+def test_parse_mapmatch_response_not_ok():
+    df_tp, df_rte, code = osrmutils._parse_mapmatch_response({'code': 'NoMatch'}, [1.0, 1.1], [2.0, 2.1])
+    assert df_tp is None and df_rte is None and code == 'NoMatch'
+
+
+def test_parse_mapmatch_response_tracepoints_only():
+    resp = {'code': 'Ok', 'tracepoints': [None, {'matchings_index': 0, 'waypoint_index': 0, 'location': [2.1, 1.1]}]}
+    df_tp, df_rte, code = osrmutils._parse_mapmatch_response(resp, [1.0, 1.1], [2.0, 2.1], parse_legs=False)
+    assert df_rte is None
+    assert pd.isna(df_tp['snap_lon'][0]) and df_tp['snap_lon'][1] == 2.1
+    assert df_tp['timestamp'].isna().all()
+
+
+def test_to_arrow_lists():
+    pa = pytest.importorskip('pyarrow')
+    latitudes = [1.0, 1.1, 1.2, 1.3]
+    longitudes = [2.0, 2.1, 2.2, 2.3]
+    _, df_rte, _ = osrmutils._parse_mapmatch_response(_response_with_unmatched_tracepoint(), latitudes, longitudes)
+    # matched rows at both ends, with empty rows in between
+    _, df_rte_matched, _ = osrmutils._parse_mapmatch_response(_ok_response(latitudes, longitudes), latitudes, longitudes)
+    df_rte = pd.concat([df_rte, df_rte_matched], ignore_index=True)
+
+    df_arrow = osrmutils._to_arrow_lists(df_rte)
+
+    assert df_arrow['node_pairs'].dtype == pd.ArrowDtype(pa.list_(pa.list_(pa.int64(), 2)))
+    assert df_arrow['distances'].dtype == pd.ArrowDtype(pa.list_(pa.float64()))
+    assert df_arrow['coords'].dtype == pd.ArrowDtype(pa.list_(pa.list_(pa.float32(), 2)))
+    assert df_arrow.index.equals(df_rte.index)
+    pd.testing.assert_frame_equal(df_arrow.drop(columns=['node_pairs', 'distances', 'coords']),
+                                  df_rte.drop(columns=['node_pairs', 'distances', 'coords']))
+    assert [[tuple(pair) for pair in row] for row in df_arrow['node_pairs'].tolist()] == df_rte['node_pairs'].tolist()
+    assert df_arrow['distances'].tolist() == df_rte['distances'].tolist()
+    for arrow_coords, coords in zip(df_arrow['coords'].tolist(), df_rte['coords']):
+        assert len(arrow_coords) == len(coords)
+        if len(coords) > 0:
+            np.testing.assert_allclose(np.array(arrow_coords, dtype=np.float64), coords, atol=1e-6)
+
+
+def _run_with_osrm_server(handler, run):
+    # serves OSRM match queries with handler on a free local port and awaits run(osrm_server) against it
+    web = pytest.importorskip('aiohttp.web')
+
+    async def _main():
+        app = web.Application()
+        app.router.add_get('/match/v1/{profile}/{coordinates}', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        try:
+            return await run('http://127.0.0.1:{}'.format(runner.addresses[0][1]))
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(_main())
+
+
+def _request_coordinates(request):
+    lonlats = [[float(value) for value in lonlat.split(',')] for lonlat in request.match_info['coordinates'].split(';')]
+    return [lat for _, lat in lonlats], [lon for lon, _ in lonlats]
+
+
+def _json_response(resp, status=200):
+    from aiohttp import web
+    return web.Response(body=json.dumps(resp).encode(), status=status, content_type='application/json')
+
+
+def test_mapmatch_many_reports_failed_chunks(monkeypatch):
+    monkeypatch.setattr(osrmutils, '_CACHE', osrmutils.OrderedDict())
+
+    async def handler(request):
+        latitudes, longitudes = _request_coordinates(request)
+        if latitudes[0] == 99:
+            return _json_response({'message': 'Bad Gateway'}, status=502)
+        return _json_response(_ok_response(latitudes, longitudes))
+
+    latitudes = np.arange(250, dtype=float)
+    trajectories = [{'latitudes': latitudes, 'longitudes': latitudes}, {'latitudes': latitudes[:50], 'longitudes': latitudes[:50]}]
+    l_results = _run_with_osrm_server(handler, lambda osrm_server: osrmutils.mapmatch_many(osrm_server, trajectories, max_matching_size=100))
+
+    df_tp, df_rte, l_code = l_results[0]
+    assert l_code[0] == 'Ok' and l_code[2] == 'Ok'
+    assert l_code[1].startswith('ClientResponseError: 502')
+    assert df_tp['query_idx'].unique().tolist() == [0, 2]
+    assert df_rte['query_idx'].unique().tolist() == [0, 2]
+    assert l_results[1][2] == ['Ok']
+
+
+def test_mapmatch_many_times_out(monkeypatch):
+    monkeypatch.setattr(osrmutils, '_CACHE', osrmutils.OrderedDict())
+
+    async def handler(request):
+        latitudes, longitudes = _request_coordinates(request)
+        if latitudes[0] == 98:
+            await asyncio.sleep(1)
+        return _json_response(_ok_response(latitudes, longitudes))
+
+    trajectories = [{'latitudes': [98.0, 98.1], 'longitudes': [1.0, 1.1]}, {'latitudes': [1.0, 1.1], 'longitudes': [1.0, 1.1]}]
+    l_results = _run_with_osrm_server(handler, lambda osrm_server: osrmutils.mapmatch_many(osrm_server, trajectories, timeout=0.2))
+
+    df_tp, df_rte, l_code = l_results[0]
+    assert df_tp is None and df_rte is None
+    assert len(l_code) == 1 and 'TimeoutError' in l_code[0]
+    assert l_results[1][2] == ['Ok']
+
+
+def test_mapmatch_many_keeps_trajectory_order(monkeypatch):
+    monkeypatch.setattr(osrmutils, '_CACHE', osrmutils.OrderedDict())
+    n_trajectories = 5
+
+    async def handler(request):
+        # the first trajectory is answered last
+        latitudes, longitudes = _request_coordinates(request)
+        await asyncio.sleep(0.05 * (n_trajectories - latitudes[0]))
+        return _json_response(_ok_response(latitudes, longitudes))
+
+    trajectories = [{'latitudes': np.full(3, float(i)), 'longitudes': np.arange(3, dtype=float)} for i in range(n_trajectories)]
+    l_results = _run_with_osrm_server(handler, lambda osrm_server: osrmutils.mapmatch_many(osrm_server, trajectories, parse_legs=False))
+
+    assert len(l_results) == n_trajectories
+    for trajectory, (df_tp, df_rte, l_code) in zip(trajectories, l_results):
+        assert l_code == ['Ok']
+        assert df_rte is None
+        assert df_tp['lat'].tolist() == trajectory['latitudes'].tolist()
+        assert df_tp['snap_lat'].tolist() == trajectory['latitudes'].tolist()